@@ -1,27 +1,42 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pathlib import Path
+from pyarrow import csv as pacsv
 from scipy import stats
 
+# copy-on-write makes masked selections views until written, so the
+# defensive .copy() calls after each filter are unnecessary
+pd.options.mode.copy_on_write = True
+
 DATA_PATH = Path("toolwindow_data.csv")
+PARQUET_PATH = DATA_PATH.with_suffix(".parquet")
 
+# above this CSV size, stream the log chunk by chunk instead of
+# materializing all events at once
+STREAMING_THRESHOLD_BYTES = 1 << 30
 
-def load_events(path: Path) -> pd.DataFrame:
-    """
-    Load the raw toolwindow log and normalize it.
+# explicit schema: skips pandas' type inference and keeps the
+# multithreaded arrow parser on the fast path
+CSV_COLUMN_TYPES = {
+    "user_id": pa.string(),
+    "timestamp": pa.int64(),
+    "event": pa.string(),
+    "event_id": pa.string(),
+    "open_type": pa.string(),
+}
 
-    Expected columns:
-      - user_id
-      - timestamp (epoch ms)
-      - event or event_id: open/close or opened/closed
-      - open_type: manual/auto for open events
-    """
-    df = pd.read_csv(path)
 
+def _normalize_events(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Clean one frame of raw events: normalize event names, validate
+    open_type, convert to categoricals. Shared by the in-memory and
+    streaming loaders; does not sort.
+    """
     df["user_id"] = df["user_id"].astype(str)
-    df["timestamp"] = pd.to_numeric(df["timestamp"], errors="coerce")
-    df = df.dropna(subset=["timestamp"]).copy()
+    df = df.dropna(subset=["timestamp"])
     df["timestamp"] = df["timestamp"].astype("int64")
 
     if "event_id" in df.columns and "event" not in df.columns:
@@ -33,31 +48,103 @@ def load_events(path: Path) -> pd.DataFrame:
     valid = df["event"].isin(["opened", "closed"])
     if (~valid).any():
         print(f"[warn] dropping {(~valid).sum()} rows with unknown event")
-        df = df[valid].copy()
+        df = df[valid]
 
     if "open_type" not in df.columns:
         df["open_type"] = ""
 
-    is_opened = df["event"] == "opened"
-    df.loc[is_opened, "open_type"] = df.loc[is_opened, "open_type"].astype(str).str.lower()
-    good_type = df.loc[is_opened, "open_type"].isin(["manual", "auto"])
+    # single pass over open_type: lowercase once, flag invalid opens and
+    # blank out closes (where open_type doesn't matter) in one go instead
+    # of repeated .loc slices and a drop-by-index
+    ot = df["open_type"].astype(str).str.lower().to_numpy()
+    is_opened = (df["event"] == "opened").to_numpy()
+    bad = is_opened & ~np.isin(ot, ("manual", "auto"))
+
+    if bad.any():
+        print(f"[warn] dropped {bad.sum()} 'opened' rows with missing/invalid open_type")
+
+    # under copy-on-write to_numpy() is a read-only view, so build the
+    # blanked-closes column with np.where instead of writing into ot
+    df["open_type"] = np.where(is_opened, ot, "")
+    df = df.loc[~bad]
+
+    # low-cardinality columns as categoricals: downstream comparisons and
+    # groupbys run on small integer codes instead of Python strings
+    df["event"] = pd.Categorical(df["event"], categories=["closed", "opened"])
+    df["open_type"] = pd.Categorical(df["open_type"], categories=["", "manual", "auto"])
+    df["user_id"] = df["user_id"].astype("category")
+
+    return df
+
 
-    if (~good_type).any():
-        dropped = (~good_type).sum()
-        print(f"[warn] dropped {dropped} 'opened' rows with missing/invalid open_type")
-        df = df.drop(df.loc[is_opened & ~good_type].index)
+def load_events(path: Path) -> pd.DataFrame:
+    """
+    Load the raw toolwindow log and normalize it.
 
-    # open_type doesn't matter on closes
-    df.loc[df["event"] == "closed", "open_type"] = ""
+    Expected columns:
+      - user_id
+      - timestamp (epoch ms)
+      - event or event_id: open/close or opened/closed
+      - open_type: manual/auto for open events
 
-    # at the same timestamp, close before open
-    order = {"closed": 0, "opened": 1}
-    df["_order"] = df["event"].map(order)
-    df = df.sort_values(["user_id", "timestamp", "_order"]).drop(columns="_order")
+    The CSV is parsed once and cached next to it as Parquet; later runs
+    read the Parquet file (column-pruned, dictionary-encoded) instead of
+    re-parsing text.
+    """
+    if PARQUET_PATH.exists():
+        wanted = pq.read_schema(PARQUET_PATH).names
+        table = pq.read_table(
+            PARQUET_PATH, columns=[c for c in CSV_COLUMN_TYPES if c in wanted]
+        )
+    else:
+        table = pacsv.read_csv(
+            path,
+            read_options=pacsv.ReadOptions(block_size=8 << 20, use_threads=True),
+            convert_options=pacsv.ConvertOptions(
+                column_types=CSV_COLUMN_TYPES,
+                null_values=[""],
+                strings_can_be_null=True,
+            ),
+        )
+        pq.write_table(table, PARQUET_PATH, compression="zstd", use_dictionary=True)
+
+    df = _normalize_events(table.to_pandas())
+
+    # sort by (user, timestamp, close-before-open) with one lexsort over
+    # the integer codes: no string comparisons, no _order temp column.
+    # The event category order (closed=0, opened=1) is the tie-break.
+    perm = np.lexsort(
+        (
+            df["event"].cat.codes.to_numpy(),
+            df["timestamp"].to_numpy(),
+            df["user_id"].cat.codes.to_numpy(),
+        )
+    )
+    df = df.iloc[perm].reset_index(drop=True)
 
     return df
 
 
+INTERVAL_COLUMNS = ["user_id", "open_ts", "close_ts", "open_type", "censored", "implicit_close"]
+
+
+def _finalize_intervals(ep: pd.DataFrame) -> pd.DataFrame:
+    """Attach duration_ms and drop zero/negative-length intervals."""
+    if ep.empty:
+        return ep
+
+    # subtract only where a close exists; censored rows keep NaN without
+    # pushing NaN arithmetic through the whole column
+    m = ~ep["censored"].to_numpy()
+    dur = np.full(len(ep), np.nan)
+    dur[m] = (
+        ep["close_ts"].to_numpy(dtype="float64", na_value=np.nan)[m]
+        - ep["open_ts"].to_numpy(dtype="float64")[m]
+    )
+    ep["duration_ms"] = dur
+    return ep[(ep["censored"]) | (ep["duration_ms"] > 0)]
+
+
 def reconstruct_intervals(events: pd.DataFrame) -> pd.DataFrame:
     """
     Reconstruct open/close intervals per user.
@@ -66,122 +153,186 @@ def reconstruct_intervals(events: pd.DataFrame) -> pd.DataFrame:
       - multiple 'opened' in a row => implicit close of previous interval
       - 'closed' without a previous open => ignored
       - open without a close before dataset end => censored
+
+    With events sorted by (user_id, timestamp), every 'opened' row is
+    terminated by the *next* event of the same user: another 'opened'
+    closes it implicitly, a 'closed' ends it explicitly, and no next
+    event means censored. Orphan closes never directly follow an open,
+    so they drop out without any per-row bookkeeping. That lets the
+    whole reconstruction run as one vectorized shift instead of a
+    Python loop.
     """
-    rows = []
+    if events.empty:
+        return pd.DataFrame()
+
+    uid = events["user_id"].to_numpy()
+    ts = events["timestamp"].to_numpy(dtype="int64")
+    is_open = (events["event"] == "opened").to_numpy()
+    ot = events["open_type"].to_numpy()
+
+    # shift-by-one lookahead: does the next row belong to the same user,
+    # and is it another open?
+    same_user = np.zeros(len(events), dtype=bool)
+    same_user[:-1] = uid[:-1] == uid[1:]
+
+    next_is_open = np.zeros(len(events), dtype=bool)
+    next_is_open[:-1] = is_open[1:]
+
+    next_ts = np.zeros(len(events), dtype=np.int64)
+    next_ts[:-1] = ts[1:]
+
+    opens = is_open
+    closed_by_next = same_user[opens]
+
+    ep = pd.DataFrame(
+        {
+            "user_id": uid[opens],
+            "open_ts": ts[opens],
+            # nullable Int64 keeps close timestamps exact integers
+            # instead of NaN-carrying floats
+            "close_ts": pd.arrays.IntegerArray(next_ts[opens], mask=~closed_by_next),
+            "open_type": ot[opens],
+            "censored": ~closed_by_next,
+            "implicit_close": closed_by_next & next_is_open[opens],
+        }
+    )
+    return _finalize_intervals(ep)
 
-    for user, g in events.groupby("user_id", sort=False):
-        open_ts = None
-        open_type = None
 
-        for _, r in g.iterrows():
-            ev = r["event"]
-            ts = int(r["timestamp"])
-            ot = (r.get("open_type") or "").strip().lower()
+class StreamingReconstructor:
+    """
+    Interval reconstruction that accepts events chunk by chunk.
 
+    Keeps only the currently-open interval per user between chunks, so
+    memory stays proportional to the number of users plus the emitted
+    intervals, not the event count of any one file.
+    """
+
+    def __init__(self):
+        self._open = {}  # user_id -> (open_ts, open_type)
+        self._rows = []
+
+    def push(self, events: pd.DataFrame) -> None:
+        """Consume one normalized chunk, in the order the log was written."""
+        opened = self._open
+        rows = self._rows
+        cols = events[["user_id", "timestamp", "event", "open_type"]]
+        for user, ts, ev, ot in cols.itertuples(index=False, name=None):
+            prev = opened.get(user)
             if ev == "opened":
-                if open_ts is not None:
-                    rows.append(
-                        {
-                            "user_id": user,
-                            "open_ts": open_ts,
-                            "close_ts": ts,
-                            "open_type": open_type,
-                            "censored": False,
-                            "implicit_close": True,
-                        }
-                    )
-                open_ts = ts
-                open_type = ot
-
-            elif ev == "closed":
-                if open_ts is None:
-                    continue
-                rows.append(
-                    {
-                        "user_id": user,
-                        "open_ts": open_ts,
-                        "close_ts": ts,
-                        "open_type": open_type,
-                        "censored": False,
-                        "implicit_close": False,
-                    }
-                )
-                open_ts = None
-                open_type = None
-
-        if open_ts is not None:
-            rows.append(
-                {
-                    "user_id": user,
-                    "open_ts": open_ts,
-                    "close_ts": np.nan,
-                    "open_type": open_type,
-                    "censored": True,
-                    "implicit_close": False,
-                }
-            )
-
-    ep = pd.DataFrame(rows)
-    if ep.empty:
-        return ep
+                if prev is not None:
+                    rows.append((user, prev[0], ts, prev[1], False, True))
+                opened[user] = (ts, ot)
+            elif prev is not None:
+                rows.append((user, prev[0], ts, prev[1], False, False))
+                del opened[user]
+
+    def finish(self) -> pd.DataFrame:
+        """Flush still-open intervals as censored and build the frame."""
+        rows = self._rows
+        for user, (ts, ot) in self._open.items():
+            rows.append((user, ts, np.nan, ot, True, False))
+        ep = pd.DataFrame.from_records(rows, columns=INTERVAL_COLUMNS)
+        if not ep.empty:
+            ep["close_ts"] = ep["close_ts"].astype("Int64")
+        return _finalize_intervals(ep)
+
+
+def reconstruct_intervals_streaming(path: Path, block_size: int = 32 << 20) -> pd.DataFrame:
+    """
+    Chunked alternative to load_events + reconstruct_intervals for logs
+    too large to hold in memory: stream the CSV block by block and carry
+    per-user open state across blocks.
 
-    ep["duration_ms"] = np.where(ep["censored"], np.nan, ep["close_ts"] - ep["open_ts"])
-    ep = ep[(ep["censored"]) | (ep["duration_ms"] > 0)].copy()
+    Assumes the log is append-ordered (chronological per user), since a
+    global re-sort is exactly what streaming avoids.
+    """
+    recon = StreamingReconstructor()
+    reader = pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(block_size=block_size, use_threads=True),
+        convert_options=pacsv.ConvertOptions(
+            column_types=CSV_COLUMN_TYPES,
+            null_values=[""],
+            strings_can_be_null=True,
+        ),
+    )
+    for batch in reader:
+        recon.push(_normalize_events(batch.to_pandas()))
+    return recon.finish()
 
-    return ep
 
+def write_csv(df: pd.DataFrame, path: str) -> None:
+    """Write a frame with pyarrow's multithreaded CSV writer."""
+    pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), path)
 
-def ecdf(x: np.ndarray):
-    x = np.sort(x)
-    y = np.arange(1, len(x) + 1) / len(x)
-    return x, y
 
+def ecdf_approx(x: np.ndarray, edges: np.ndarray):
+    """
+    ECDF evaluated at precomputed bin edges: one binning pass plus a
+    cumulative sum, no sort. At plot resolution the stair is
+    indistinguishable from the exact ECDF.
+    """
+    counts, _ = np.histogram(x, bins=edges)
+    y = np.cumsum(counts) / counts.sum()
+    return edges[1:], y
 
-def main():
-    print(f"Loading: {DATA_PATH.resolve()}")
-    events = load_events(DATA_PATH)
-    print(f"Events: {len(events):,}")
 
-    intervals = reconstruct_intervals(events)
+def main():
+    if not PARQUET_PATH.exists() and DATA_PATH.stat().st_size > STREAMING_THRESHOLD_BYTES:
+        print(f"Loading (streaming): {DATA_PATH.resolve()}")
+        intervals = reconstruct_intervals_streaming(DATA_PATH)
+    else:
+        print(f"Loading: {DATA_PATH.resolve()}")
+        events = load_events(DATA_PATH)
+        print(f"Events: {len(events):,}")
+        intervals = reconstruct_intervals(events)
     print(f"Intervals: {len(intervals):,}")
     print(f"Censored intervals: {intervals['censored'].sum():,}")
 
-    intervals.to_csv("toolwindow_intervals.csv", index=False)
+    # Parquet is the canonical output for downstream reuse (typed,
+    # compressed, with row-group statistics); the CSV stays for eyeballing
+    pq.write_table(
+        pa.Table.from_pandas(intervals, preserve_index=False),
+        "toolwindow_intervals.parquet",
+        compression="zstd",
+        use_dictionary=True,
+        row_group_size=1_000_000,
+    )
+    print("Wrote toolwindow_intervals.parquet")
+
+    write_csv(intervals, "toolwindow_intervals.csv")
     print("Wrote toolwindow_intervals.csv")
 
-    complete = intervals[~intervals["censored"]].copy()
-    complete = complete[complete["open_type"].isin(["manual", "auto"])].copy()
+    complete = intervals[~intervals["censored"]]
+    complete = complete[complete["open_type"].isin(["manual", "auto"])]
 
     if complete.empty:
         print("No completed intervals with valid open_type. Exiting.")
         return
 
-    complete["duration_s"] = complete["duration_ms"] / 1000.0
-
-    summary = (
-        complete.groupby("open_type")["duration_ms"]
-        .agg(
-            n="size",
-            mean_ms="mean",
-            median_ms="median",
-            p25_ms=lambda s: s.quantile(0.25),
-            p75_ms=lambda s: s.quantile(0.75),
-            p90_ms=lambda s: s.quantile(0.90),
-            std_ms="std",
-        )
-        .reset_index()
-    )
+    complete["duration_s"] = (complete["duration_ms"] / 1000.0).clip(lower=1e-6)
+    # take the log once; the t-test and the log-scale bin limits reuse it
+    complete["log_dur_s"] = np.log(complete["duration_s"].to_numpy())
+
+    # one batched quantile call shares a single sort per group instead of
+    # re-sorting inside a lambda for every percentile
+    grouped = complete.groupby("open_type")["duration_ms"]
+    basic = grouped.agg(n="size", mean_ms="mean", std_ms="std")
+    quantiles = grouped.quantile([0.25, 0.50, 0.75, 0.90]).unstack()
+    quantiles.columns = ["p25_ms", "median_ms", "p75_ms", "p90_ms"]
+    summary = basic.join(quantiles).reset_index()
+    summary = summary[
+        ["open_type", "n", "mean_ms", "median_ms", "p25_ms", "p75_ms", "p90_ms", "std_ms"]
+    ]
     print("\nSummary by open_type:\n", summary.to_string(index=False))
-    summary.to_csv("summary_by_open_type.csv", index=False)
+    write_csv(summary, "summary_by_open_type.csv")
     print("Wrote summary_by_open_type.csv")
 
-    manual = complete.loc[complete["open_type"] == "manual", "duration_s"].values
-    auto = complete.loc[complete["open_type"] == "auto", "duration_s"].values
-
-    if len(manual) > 1 and len(auto) > 1:
-        manual_log = np.log(manual)
-        auto_log = np.log(auto)
+    manual_log = complete.loc[complete["open_type"] == "manual", "log_dur_s"].to_numpy()
+    auto_log = complete.loc[complete["open_type"] == "auto", "log_dur_s"].to_numpy()
 
+    if len(manual_log) > 1 and len(auto_log) > 1:
         t_stat, p_val = stats.ttest_ind(auto_log, manual_log, equal_var=False)
         diff_log = auto_log.mean() - manual_log.mean()
         ratio = np.exp(diff_log)
@@ -192,39 +343,34 @@ def main():
     else:
         print("\nNot enough data for a statistical test.\n")
 
-    intervals_sorted = intervals.sort_values(["user_id", "open_ts"]).copy()
-    intervals_sorted["seq"] = intervals_sorted.groupby("user_id").cumcount()
-
-    implicit = intervals_sorted.loc[
-        (~intervals_sorted["censored"]) & (intervals_sorted["implicit_close"]),
-        ["user_id", "seq", "open_type"],
-    ].copy()
-    implicit["seq_next"] = implicit["seq"] + 1
-
-    next_map = intervals_sorted[["user_id", "seq", "open_type"]].rename(
-        columns={"open_type": "next_open_type"}
-    )
-
-    next_pairs = implicit.merge(
-        next_map,
-        left_on=["user_id", "seq_next"],
-        right_on=["user_id", "seq"],
-        how="left",
-        suffixes=("", "_y"),
+    intervals_sorted = intervals.sort_values(["user_id", "open_ts"])
+
+    # the interval that implicitly closed this one is simply the next
+    # interval of the same user, so a shift(-1) within each user replaces
+    # the old seq/merge lookup
+    intervals_sorted["next_open_type"] = intervals_sorted.groupby(
+        "user_id", sort=False
+    )["open_type"].shift(-1)
+
+    # count the 2x2 transitions directly on integer codes; a crosstab
+    # materializes several frames for what is a four-cell histogram
+    types = ["manual", "auto"]
+    cur = pd.Categorical(intervals_sorted["open_type"], categories=types).codes
+    nxt = pd.Categorical(intervals_sorted["next_open_type"], categories=types).codes
+    mask = (
+        (~intervals_sorted["censored"]).to_numpy()
+        & intervals_sorted["implicit_close"].to_numpy()
+        & (cur >= 0)
+        & (nxt >= 0)  # code -1 covers both NaN and blank open_type
     )
-
-    transition_counts = (
-        next_pairs.dropna(subset=["next_open_type"])
-        .value_counts(["open_type", "next_open_type"])
-        .rename("count")
-        .reset_index()
-        .pivot(index="open_type", columns="next_open_type", values="count")
-        .fillna(0)
-        .astype(int)
+    matrix = np.zeros((2, 2), dtype=np.int64)
+    np.add.at(matrix, (cur[mask], nxt[mask]), 1)
+    transition_counts = pd.DataFrame(matrix, index=types, columns=types).rename_axis(
+        index="open_type", columns="next_open_type"
     )
 
     print("\nImplicit-close transitions:\n", transition_counts)
-    transition_counts.to_csv("implicit_transition_counts.csv")
+    write_csv(transition_counts.reset_index(), "implicit_transition_counts.csv")
     print("Wrote implicit_transition_counts.csv")
 
     print("\nGenerating plots...")
@@ -239,19 +385,22 @@ def main():
     plt.savefig("plot_counts_by_open_type.png", dpi=150)
     plt.close()
 
-    complete["duration_s"] = complete["duration_s"].clip(lower=1e-6)
-    bins = np.logspace(
-        np.log10(complete["duration_s"].min()),
-        np.log10(complete["duration_s"].max()),
-        50,
-    )
+    # slice each group's durations once; the histogram, ECDF and boxplot
+    # all reuse these arrays instead of re-masking the frame
+    duration_by_type = {
+        t: complete.loc[complete["open_type"] == t, "duration_s"].to_numpy()
+        for t in ["manual", "auto"]
+    }
+
+    # bin edges from the precomputed logs: linspace in log space, then exp
+    bins = np.exp(np.linspace(complete["log_dur_s"].min(), complete["log_dur_s"].max(), 50))
 
     plt.figure(figsize=(8, 5))
-    for t in ["manual", "auto"]:
-        data = complete.loc[complete["open_type"] == t, "duration_s"].values
+    for t, data in duration_by_type.items():
         if len(data) == 0:
             continue
-        plt.hist(data, bins=bins, alpha=0.5, label=t)
+        hist_counts, edges = np.histogram(data, bins=bins)
+        plt.stairs(hist_counts, edges, fill=True, alpha=0.5, label=t)
     plt.xscale("log")
     plt.title("Duration Histogram (seconds, log scale)")
     plt.xlabel("duration (s, log)")
@@ -262,11 +411,10 @@ def main():
     plt.close()
 
     plt.figure(figsize=(8, 5))
-    for t in ["manual", "auto"]:
-        data = complete.loc[complete["open_type"] == t, "duration_s"].values
+    for t, data in duration_by_type.items():
         if len(data) == 0:
             continue
-        xs, ys = ecdf(data)
+        xs, ys = ecdf_approx(data, bins)
         plt.plot(xs, ys, drawstyle="steps-post", label=t)
     plt.xscale("log")
     plt.title("ECDF of Interval Duration (seconds, log x)")
@@ -277,10 +425,9 @@ def main():
     plt.savefig("plot_ecdf_log_seconds.png", dpi=150)
     plt.close()
 
-    groups = ["manual", "auto"]
-    data = [complete.loc[complete["open_type"] == t, "duration_s"].values for t in groups]
+    groups = list(duration_by_type)
     plt.figure(figsize=(7, 5))
-    plt.boxplot(data, labels=groups, showfliers=False)
+    plt.boxplot(list(duration_by_type.values()), labels=groups, showfliers=False)
     plt.yscale("log")
     plt.title("Boxplot of Duration (seconds, log scale)")
     plt.xlabel("open_type")